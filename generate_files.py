@@ -1,11 +1,22 @@
+import asyncio
+import hashlib
+import importlib.util
+import io
+import mmap
+import multiprocessing
 import os
+import random
 import re
 import sys
-import requests
+import shutil
+import subprocess
+import tempfile
+import orjson
 from dotenv import load_dotenv
 from datetime import datetime
-from PyPDF2 import PdfReader
+from pathlib import Path
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # === Konfiguration laden ===
 load_dotenv()
@@ -19,9 +30,43 @@ ERROR_FILE = "error.txt"
 DEBUG_FILE = "debug.txt"
 RESULT_FILE = os.path.join(OUTPUT_DIR, "result.md")
 RESPONSE_FILE = os.path.join(OUTPUT_DIR, "response.md")
+PDF_CACHE_DIR = os.path.join(OUTPUT_DIR, ".cache")
+BATCH_INPUT_FILE = os.path.join(OUTPUT_DIR, "fixes.jsonl")
+BATCH_ID_FILE = os.path.join(OUTPUT_DIR, "batch_id.txt")
+API_BASE = "https://api.openai.com/v1"
+JSON_HEADERS = {"Content-Type": "application/json"}
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0  # Sekunden
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+FIX_FILES_PER_REQUEST = 4  # so viele Java-Dateien werden pro Fix-Anfrage gebündelt
+# Ab dieser Seitenzahl wird parallel extrahiert. Ein spawn-Worker kostet gemessen ~0,15 s Start
+# (Interpreter + Import dieses Moduls + Kopie der PDF), PyMuPDF braucht ~1 ms pro Seite;
+# darunter ist die sequentielle Schleife schneller.
+PARALLEL_PAGE_THRESHOLD = 200
+IO_WORKERS = 16  # Threads für paralleles Lesen/Schreiben der Java-Dateien
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# === Reguläre Ausdrücke (einmal beim Laden kompiliert) ===
+CODE_BLOCK_RE = re.compile(r"```(?:java)?(.*?)```", re.DOTALL | re.IGNORECASE)
+FILE_COMMENT_RE = re.compile(r"//\s*File\s*:\s*([A-Za-z0-9_./\\-]+)", re.IGNORECASE)
+# Führende '// File:'/'// Datei:'-Kopfzeilen (auch mehrfach) am Anfang eines Codeblocks
+FILE_HEADER_RE = re.compile(r"\A(?:[ \t]*//[ \t]*(?:File|Datei)[ \t]*:[^\n]*(?:\n|\Z)\s*)+", re.IGNORECASE)
+# Überspringt Kommentare/Strings und findet in einem Durchlauf die erste Typdeklaration (Gruppe 1/2)
+SCAN_RE = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"""(?:\\.|[^\\])*?"""|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+    r'|\b(?:public\s+)?(class|interface|enum|record)\s+([A-Za-z_]\w*)',
+    re.DOTALL,
+)
+DECL_RE = re.compile(r'(?:^|\s)(public\s+|protected\s+|private\s+|static\s+|final\s+|abstract\s+|strictfp\s+)*'
+                     r'(class|interface|enum|record)\s+([A-Za-z_]\w*)', re.MULTILINE)
+# Kommentare, Text-Blöcke, Strings, Char-Literale oder einzelne Klammern
+BRACE_TOKEN_RE = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"""(?:\\.|[^\\])*?"""|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|[{}]',
+    re.DOTALL,
+)
+SANITIZE_RE = re.compile(r'[^A-Za-z0-9_]')
+
 # === Hilfsfunktionen ===
 
 
@@ -32,13 +77,15 @@ def print_help():
 Verwendung:
   python3 klausurgen.py             → Generiert Java-Dateien aus PDF und Prompt
   python3 klausurgen.py --fix       → Liest vorhandene .java-Dateien und error.txt, sendet alles zur Korrektur
+  python3 klausurgen.py --fix-batch → Wie --fix, aber als OpenAI-Batch (günstiger, asynchron, bis zu 24h)
+  python3 klausurgen.py --fix-poll  → Prüft den Batch aus --fix-batch und speichert die Ergebnisse, falls fertig
   python3 klausurgen.py --debug     → Liest debug.txt (Prompt) und result.md (Code), sendet alles an API und erstellt eine response.md mit der antwort
   python3 klausurgen.py --help      → Zeigt diese Hilfe an
 
 Dateien & Umgebungsvariablen:
   prompt.txt       Enthält deine Aufgabenbeschreibung oder den Prompt
   klausur.pdf      PDF mit der Klausuraufgabe
-  error.txt        Enthält Compiler-Fehler (nur für --fix / --debug)
+  error.txt        Enthält Compiler-Fehler (nur für --fix / --fix-batch / --debug)
   debug.txt        Freier Prompt für Debugging-Modus (--debug)
   result.md        Enthält deinen bestehenden Code (wird im Debug-Modus gesendet)
   .env             Muss OPENAI_API_KEY enthalten
@@ -50,35 +97,458 @@ Optionale ENV-Variablen:
     print(help_text)
 
 
-def call_openai(messages):
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-    }
+def _retry_delay(attempt, response=None):
+    """Wartezeit vor dem nächsten Versuch: Retry-After falls vorhanden, sonst exponentiell mit Jitter."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random())
+
+
+async def _request_with_retry(client, method, url, stream=False, retry_timeouts=True, **kwargs):
+    """
+    Führt die Anfrage aus und wiederholt sie bei 429/5xx und Verbindungs-/Timeout-Fehlern
+    mit exponentiellem Backoff. Andere Fehler werden sofort weitergereicht.
+    Mit retry_timeouts=False werden nur Fehler beim Verbindungsaufbau wiederholt, bei denen die
+    Anfrage sicher nicht angekommen ist (für Anfragen, die nicht doppelt ausgeführt werden dürfen).
+    Mit stream=True wird der Body nicht gelesen; der Aufrufer muss die Antwort mit aclose() schließen.
+    """
+    import httpx
+
+    if retry_timeouts:
+        retryable_errors = (httpx.TimeoutException, httpx.NetworkError)
+    else:
+        retryable_errors = (httpx.ConnectTimeout, httpx.ConnectError)
+
+    for attempt in range(MAX_RETRIES):
+        last_try = attempt == MAX_RETRIES - 1
+        try:
+            request = client.build_request(method, url, **kwargs)
+            response = await client.send(request, stream=stream)
+        except retryable_errors as e:
+            if last_try:
+                raise
+            delay = _retry_delay(attempt)
+            print(f"⏳ Verbindungsfehler ({e.__class__.__name__}), neuer Versuch in {delay:.1f}s...")
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or last_try:
+                if stream and response.is_error:
+                    await response.aread()
+                    await response.aclose()
+                response.raise_for_status()
+                return response
+            if stream:
+                await response.aclose()
+            delay = _retry_delay(attempt, response)
+            print(f"⏳ HTTP {response.status_code}, neuer Versuch in {delay:.1f}s...")
+        await asyncio.sleep(delay)
+
+
+def _chat_payload(messages, json_reply=False):
     payload = {
         "model": MODEL,
         "messages": messages,
         "temperature": 0.1,
     }
+    if json_reply:
+        # JSON-Modus: die Antwort ist garantiert ein gültiges JSON-Objekt
+        payload["response_format"] = {"type": "json_object"}
+    return payload
+
+
+async def call_openai(client, messages, output_path=None, json_reply=False):
+    """
+    Sendet die Nachrichten an die Chat-Completions-API und gibt den Antworttext zurück.
+    Mit output_path wird die Antwort gestreamt (SSE) und dabei fortlaufend in die Datei geschrieben.
+    Mit json_reply=True wird der JSON-Modus der API angefordert.
+    """
+    url = "/chat/completions"
+    payload = _chat_payload(messages, json_reply)
 
     print(f"🚀 Sende Anfrage an OpenAI mit Modell '{MODEL}'...")
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"]
+    if output_path is None:
+        response = await _request_with_retry(
+            client, "POST", url, content=orjson.dumps(payload), headers=JSON_HEADERS
+        )
+        return orjson.loads(response.content)["choices"][0]["message"]["content"]
+
+    payload["stream"] = True
+    response = await _request_with_retry(
+        client, "POST", url, stream=True, content=orjson.dumps(payload), headers=JSON_HEADERS
+    )
+    print(f"📝 Antwort wird gestreamt nach: {output_path}")
+    parts = []
+    try:
+        with open(output_path, "w", encoding="utf-8") as f:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = orjson.loads(data).get("choices") or []
+                chunk = choices[0].get("delta", {}).get("content") if choices else None
+                if chunk:
+                    f.write(chunk)
+                    parts.append(chunk)
+    finally:
+        await response.aclose()
+    return "".join(parts)
+
+
+def _build_fix_messages(files, all_names, error_text):
+    """
+    Baut die Chat-Nachrichten für die Korrektur der übergebenen (name, code)-Paare.
+    Mehrere Dateien teilen sich eine Anfrage; die Antwort kommt als JSON-Objekt zurück.
+    """
+    code_summary = "\n\n".join(f"// Datei: {n}\n{c}" for n, c in files)
+    fix_prompt = (
+        "Du bist ein erfahrener Java-Entwickler. "
+        "Hier sind Java-Dateien aus einem Projekt und eine Compiler-Fehlermeldung. "
+        "Analysiere den Fehler und gib die korrigierten vollständigen Java-Dateien zurück.\n\n"
+        f"Alle Dateien im Projekt: {', '.join(all_names)}\n\n"
+        f"{code_summary}\n\nCompiler-Fehlermeldung:\n{error_text}"
+    )
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Du bist ein Java-Code-Fixer. Antworte ausschließlich mit einem JSON-Objekt "
+                '{"files": [{"filename": "<Dateiname>.java", "code": "<vollständiger Java-Code>"}]}, '
+                "mit einem Eintrag pro übergebener Datei, ohne weiteren Text. "
+                "Der Code enthält keine '// Datei:'- oder '// File:'-Kopfzeile."
+            ),
+        },
+        {"role": "user", "content": fix_prompt},
+    ]
+
+
+def _group_fix_files(java_files):
+    """Teilt die Java-Dateien in Gruppen zu je FIX_FILES_PER_REQUEST (name, code)-Paaren."""
+    items = list(java_files.items())
+    return [items[i:i + FIX_FILES_PER_REQUEST] for i in range(0, len(items), FIX_FILES_PER_REQUEST)]
+
+
+def _parse_fix_reply(reply):
+    """
+    Liest eine JSON-Antwort {"files": [{"filename": ..., "code": ...}]} (oder ein bloßes Array)
+    und gibt eine Liste von (dateiname, code)-Paaren zurück, oder None, falls die Antwort
+    kein gültiges JSON in diesem Format ist oder keinen einzigen gültigen Eintrag enthält.
+    Ungültige Einträge werden übersprungen.
+    """
+    text = reply.strip()
+    if text.startswith("```"):
+        # Modell hat das JSON trotzdem in einen Codeblock gepackt
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    try:
+        data = orjson.loads(text)
+    except ValueError:
+        return None
+    entries = data.get("files") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        return None
+
+    files = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        filename, code = entry.get("filename"), entry.get("code")
+        if not isinstance(filename, str) or not isinstance(code, str):
+            continue
+        filename = os.path.basename(filename.strip())
+        # Kopfzeilen entfernen, sonst sammeln sie sich bei jedem --fix-Lauf in der Datei an
+        code = FILE_HEADER_RE.sub("", code.strip()).strip()
+        if not filename or not code:
+            continue
+        if not filename.lower().endswith(".java"):
+            filename += ".java"
+        files.append((filename, code))
+    return files or None
+
+
+async def submit_fix_batch(client, requests_by_id):
+    """
+    Lädt die Anfragen als JSONL-Datei hoch und startet einen Batch auf /v1/chat/completions.
+    Gibt die Batch-ID zurück.
+    """
+    lines = [
+        orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _chat_payload(messages, json_reply=True),
+        })
+        for custom_id, messages in requests_by_id.items()
+    ]
+    content = b"\n".join(lines) + b"\n"
+    _write_all(BATCH_INPUT_FILE, content)
+
+    print(f"📤 Lade Batch-Datei hoch ({len(lines)} Anfragen)...")
+    # Kein Retry nach Timeouts: die Anfrage könnte schon angenommen sein (doppelter, bezahlter Batch)
+    response = await _request_with_retry(
+        client, "POST", "/files", retry_timeouts=False,
+        data={"purpose": "batch"},
+        files={"file": (os.path.basename(BATCH_INPUT_FILE), content, "application/jsonl")},
+    )
+    input_file_id = orjson.loads(response.content)["id"]
+
+    response = await _request_with_retry(
+        client, "POST", "/batches", retry_timeouts=False,
+        content=orjson.dumps({
+            "input_file_id": input_file_id,
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+        }),
+        headers=JSON_HEADERS,
+    )
+    return orjson.loads(response.content)["id"]
+
+
+async def retrieve_batch(client, batch_id):
+    """
+    Fragt den Batch-Status ab. Gibt (status, replies) zurück, wobei replies die
+    Antworttexte in der Reihenfolge der Ausgabedatei enthält (nur wenn 'completed').
+    """
+    response = await _request_with_retry(client, "GET", f"/batches/{batch_id}")
+    batch = orjson.loads(response.content)
+    status = batch["status"]
+    if status != "completed" or not batch.get("output_file_id"):
+        return status, []
+
+    response = await _request_with_retry(
+        client, "GET", f"/files/{batch['output_file_id']}/content"
+    )
+    replies = []
+    for line in response.content.splitlines():
+        if not line.strip():
+            continue
+        result = orjson.loads(line)
+        resp = result.get("response") or {}
+        if result.get("error") or resp.get("status_code") != 200:
+            print(f"⚠️ Anfrage '{result.get('custom_id')}' fehlgeschlagen: {result.get('error') or resp.get('body')}")
+            continue
+        replies.append(resp["body"]["choices"][0]["message"]["content"])
+    return status, replies
+
+
+def _read_java_source(path):
+    """
+    Liest eine Java-Datei über mmap: dekodiert direkt aus dem Page-Cache, ohne
+    Zwischenkopie als bytes-Objekt. Zeilenenden werden wie im Textmodus zu '\\n'.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""  # leere Dateien lassen sich nicht mappen
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            content = str(mm, "utf-8")
+    if "\r" in content:
+        content = content.replace("\r\n", "\n").replace("\r", "\n")
+    return content
+
+
+def _write_all(path, content):
+    """Schreibt content (str oder bytes) ohne gepufferten IO-Stack, i.d.R. mit einem einzigen write-Syscall."""
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _load_fix_inputs():
+    """Liest alle Java-Dateien aus OUTPUT_DIR und den Fehlertext (beendet das Programm, falls etwas fehlt)."""
+    with os.scandir(OUTPUT_DIR) as it:
+        entries = [e for e in it if e.name.endswith(".java") and e.is_file()]
+    # Dateien parallel lesen, damit sich die Latenzen der einzelnen Zugriffe überlappen
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as ex:
+        contents = ex.map(_read_java_source, (e.path for e in entries))
+        java_files = dict(zip((e.name for e in entries), contents))
+
+    if not java_files:
+        print("⚠️ Keine Java-Dateien im Output-Ordner gefunden.")
+        sys.exit(1)
+
+    # Fehlertext einlesen
+    try:
+        error_text = Path(ERROR_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        print(f"⚠️ Fehlerdatei '{ERROR_FILE}' nicht gefunden.")
+        sys.exit(1)
+
+    return java_files, error_text
+
+
+def _save_fix_replies(replies):
+    """
+    Schreibt die Fix-Antworten als fix_<timestamp>.md und überschreibt die korrigierten Java-Dateien.
+    Antworten, die sich nicht als JSON lesen lassen oder keine gültigen Einträge enthalten,
+    landen nur in der Markdown-Datei.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    sections = []
+    outputs = {}
+    for reply in replies:
+        files = _parse_fix_reply(reply)
+        if files is None:
+            print("⚠️ Antwort ist kein gültiges JSON oder enthält keine gültigen Dateien, "
+                  "Dateien dieser Gruppe bleiben unverändert.")
+            sections.append(reply)
+            continue
+        for filename, code in files:
+            sections.append(f"```java\n// File: {filename}\n{code}\n```")
+            outputs[os.path.join(OUTPUT_DIR, filename)] = code + "\n"
+
+    output_md = os.path.join(OUTPUT_DIR, f"fix_{timestamp}.md")
+    _write_all(output_md, "\n\n".join(sections))
+    print(f"✅ Fix-Ergebnis gespeichert in: {output_md}")
+
+    if not outputs:
+        print("⚠️ Keine korrigierten Java-Dateien erhalten.")
+        return
+    _write_java_files(outputs)
+    print("🎉 Java-Dateien wurden mit den Korrekturen überschrieben.")
+
+
+def _new_client():
+    """
+    Ein gemeinsamer Client pro Lauf: alle Anfragen teilen sich Connection-Pool (Keep-Alive,
+    HTTP/2) und Auth-Header, der TLS-Handshake fällt nur einmal an.
+    """
+    import httpx  # erst hier laden, --help braucht keinen HTTP-Stack
+
+    return httpx.AsyncClient(
+        base_url=API_BASE,
+        headers={"Authorization": f"Bearer {API_KEY}"},
+        http2=True,
+        timeout=httpx.Timeout(120),
+    )
+
+
+async def _warm_up(client):
+    """Baut die Verbindung zu api.openai.com vorab auf (Fehler werden ignoriert)."""
+    import httpx
+
+    try:
+        await client.head("/models")
+    except httpx.HTTPError:
+        pass
+
+
+def _extract_pages(pdf_bytes, start, stop):
+    """Worker für den ProcessPool: öffnet die PDF aus dem Puffer und liest Seiten [start, stop)."""
+    import pymupdf
+
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return "\n".join(doc[i].get_text("text") for i in range(start, stop))
 
 
 def pdf_to_text(pdf_path):
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
+    """
+    Extrahiert den Text aus der PDF.
+    Die Datei wird einmal komplett in den Speicher gelesen, danach parst der Parser
+    nur noch auf dem Puffer (keine vielen kleinen Lese-/Seek-Zugriffe auf die Datei).
+    Der Text wird unter dem Hash des PDF-Inhalts und dem Namen des Parsers in PDF_CACHE_DIR
+    zwischengespeichert: eine unveränderte PDF wird nur beim ersten Lauf geparst, nach der
+    Installation eines besseren Parsers (z.B. PyMuPDF) aber neu gelesen.
+    """
+    with open(pdf_path, "rb") as fh:
+        data = fh.read()
+
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    try:
+        with open(_pdf_cache_path(digest, _preferred_pdf_parser()), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    text, parser = _parse_pdf(data)
+    cache_path = _pdf_cache_path(digest, parser)
+
+    # Atomar schreiben, damit ein abgebrochener Lauf keinen halben Cache-Eintrag hinterlässt
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=PDF_CACHE_DIR, suffix=".tmp", delete=False
+    ) as tmp:
+        tmp.write(text)
+    os.replace(tmp.name, cache_path)
     return text
 
 
+def _pdf_cache_path(digest, parser):
+    return os.path.join(PDF_CACHE_DIR, f"{digest}-{parser}.txt")
+
+
+def _preferred_pdf_parser():
+    """Name des Parsers, den _parse_pdf zuerst versuchen wird (ohne ihn zu importieren)."""
+    if importlib.util.find_spec("pymupdf") is not None:
+        return "pymupdf"
+    if shutil.which("pdftotext"):
+        return "pdftotext"
+    return "pypdf2"
+
+
+def _parse_pdf(data):
+    """
+    Parst die PDF-Bytes und gibt (text, parser_name) zurück.
+    Reihenfolge: PyMuPDF (schnell, C-Bibliothek) -> pdftotext CLI -> PyPDF2 (langsam).
+    Die PDF-Bibliotheken werden erst hier importiert, die anderen Modi laden sie nie.
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        pymupdf = None
+
+    if pymupdf is not None:
+        with pymupdf.open(stream=data, filetype="pdf") as doc:
+            n_pages = doc.page_count
+            workers = min(os.cpu_count() or 1, n_pages)
+            if n_pages <= PARALLEL_PAGE_THRESHOLD or workers < 2:
+                return "\n".join(page.get_text("text") for page in doc), "pymupdf"
+
+        # Große PDFs: Seitenbereiche auf mehrere Prozesse verteilen (umgeht den GIL).
+        # "spawn" statt fork: pdf_to_text läuft im Generate-Modus in einem Worker-Thread,
+        # und fork() aus einem Prozess mit mehreren Threads kann im Kind deadlocken.
+        step = -(-n_pages // workers)  # aufrunden
+        ranges = [(start, min(start + step, n_pages)) for start in range(0, n_pages, step)]
+        with ProcessPoolExecutor(
+            max_workers=len(ranges), mp_context=multiprocessing.get_context("spawn")
+        ) as ex:
+            futures = [ex.submit(_extract_pages, data, start, stop) for start, stop in ranges]
+            return "\n".join(f.result() for f in futures), "pymupdf"
+
+    if shutil.which("pdftotext"):
+        result = subprocess.run(
+            ["pdftotext", "-layout", "-", "-"], input=data, capture_output=True
+        )
+        if result.returncode == 0:
+            return result.stdout.decode("utf-8", errors="replace"), "pdftotext"
+
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
+        raise RuntimeError(
+            "Kein PDF-Parser verfügbar. Bitte PyMuPDF installieren (pip install PyMuPDF)."
+        ) from None
+
+    reader = PdfReader(io.BytesIO(data))
+    parts = []
+    for page in reader.pages:
+        # extract_text() kann bei Seiten ohne Text None liefern
+        parts.append(page.extract_text() or "")
+    return "\n".join(parts), "pypdf2"
+
+
 def _sanitize_filename(name: str) -> str:
     # Erlaubt nur Buchstaben, Zahlen und Unterstrich (kein Leerzeichen, kein Sonderzeichen)
-    return re.sub(r'[^A-Za-z0-9_]', '_', name)
+    return SANITIZE_RE.sub('_', name)
 
 def _extract_package_and_imports(block: str) -> str:
     """Gibt die führenden package/import-Zeilen zurück (inkl. trailing newline)."""
@@ -105,10 +575,8 @@ def _find_declarations_with_spans(block: str):
     Findet top-level declarations (class/interface/enum/record) und liefert
     tuples (kind, name, start_index_of_declaration).
     """
-    pattern = re.compile(r'(?:^|\s)(public\s+|protected\s+|private\s+|static\s+|final\s+|abstract\s+|strictfp\s+)*'
-                         r'(class|interface|enum|record)\s+([A-Za-z_]\w*)', re.MULTILINE)
     results = []
-    for m in pattern.finditer(block):
+    for m in DECL_RE.finditer(block):
         kind = m.group(2)
         name = m.group(3)
         start = m.start(2)  # Beginn bei 'class'/'interface'...
@@ -118,85 +586,53 @@ def _find_declarations_with_spans(block: str):
 def _find_matching_brace_end(s: str, start_index_of_open_brace: int) -> int:
     """
     Scannt ab dem Index der öffnenden '{' und gibt Index der schließenden '}' zurück,
-    unter Berücksichtigung von Strings und Kommentaren (einfache, robuste Handhabung).
+    unter Berücksichtigung von Strings und Kommentaren.
+    Kommentare und String-/Char-Literale werden per Regex als Ganzes übersprungen,
+    so dass nur die Klammern einzeln in Python verarbeitet werden.
     Falls kein match gefunden wird, gibt -1 zurück.
     """
-    i = start_index_of_open_brace
     depth = 0
-    length = len(s)
-    in_single_quote = False
-    in_double_quote = False
-    in_line_comment = False
-    in_block_comment = False
-    while i < length:
-        ch = s[i]
-        nx = s[i+1] if i+1 < length else ''
-        # Kommentarstart/ende
-        if not in_single_quote and not in_double_quote:
-            if not in_block_comment and ch == '/' and nx == '/':
-                in_line_comment = True
-                i += 1
-            elif not in_line_comment and ch == '/' and nx == '*':
-                in_block_comment = True
-                i += 1
-            elif in_line_comment and ch == '\n':
-                in_line_comment = False
-            elif in_block_comment and ch == '*' and nx == '/':
-                in_block_comment = False
-                i += 1
-                # continue scanning after closing
-        # Zitat-Handling (nur wenn nicht in Kommentaren)
-        if not in_line_comment and not in_block_comment:
-            if ch == '"' and not in_single_quote:
-                # prüfe Escape
-                escape_count = 0
-                j = i - 1
-                while j >= 0 and s[j] == '\\':
-                    escape_count += 1
-                    j -= 1
-                if escape_count % 2 == 0:
-                    in_double_quote = not in_double_quote
-            elif ch == "'" and not in_double_quote:
-                escape_count = 0
-                j = i - 1
-                while j >= 0 and s[j] == '\\':
-                    escape_count += 1
-                    j -= 1
-                if escape_count % 2 == 0:
-                    in_single_quote = not in_single_quote
-
-            # Klammerzählung nur wenn wir nicht in einem String sind
-            if not in_double_quote and not in_single_quote:
-                if ch == '{':
-                    depth += 1
-                elif ch == '}':
-                    depth -= 1
-                    if depth == 0:
-                        return i  # Index der schließenden '}'
-        i += 1
+    for m in BRACE_TOKEN_RE.finditer(s, start_index_of_open_brace):
+        token = m.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth == 0:
+                return m.start()  # Index der schließenden '}'
     return -1
 
+def _find_type_name(block: str):
+    """
+    Liefert den Namen der ersten class/interface/enum/record-Deklaration außerhalb von
+    Kommentaren und Strings, oder None. Ein einziger Durchlauf, ohne bereinigte Kopie.
+    """
+    for m in SCAN_RE.finditer(block):
+        if m.group(1) is not None:
+            return m.group(2)
+    return None
+
 def save_java_files(reply, timestamp):
     """
     Parses AI output and writes .java files with proper filenames.
     - Uses // File: ... if available
-    - Removes comments before class detection (so 'class' in comments won't trigger)
+    - Skips comments and strings during class detection (so 'class' in comments won't trigger)
     - Supports class, interface, enum, and record
     """
-    code_blocks = re.findall(r"```(?:java)?(.*?)```", reply, re.DOTALL | re.IGNORECASE)
+    code_blocks = CODE_BLOCK_RE.findall(reply)
     if not code_blocks:
         print("⚠️ Keine Java-Codeblöcke im Output gefunden.")
         return
 
+    # filename -> Inhalt; bei doppelten Namen gewinnt wie bisher der letzte Block
+    outputs = {}
     for idx, block in enumerate(code_blocks, start=1):
         original_block = block.strip()
         if not original_block:
             continue
 
         # --- 1️⃣ Look for explicit filename comment ---
-        file_comment_match = re.search(
-            r"//\s*File\s*:\s*([A-Za-z0-9_./\\-]+)", original_block, re.IGNORECASE
-        )
+        file_comment_match = FILE_COMMENT_RE.search(original_block)
         if file_comment_match:
             raw_name = file_comment_match.group(1).strip()
             # Add .java if not present
@@ -204,100 +640,138 @@ def save_java_files(reply, timestamp):
                 raw_name += ".java"
             filename = os.path.join(OUTPUT_DIR, os.path.basename(raw_name))
         else:
-            # --- 2️⃣ Remove comments before scanning for class/interface/enum/record ---
-            # Remove all // ... and /* ... */ comments
-            cleaned = re.sub(r"//.*?$|/\*.*?\*/", "", original_block, flags=re.DOTALL | re.MULTILINE)
-
-            # Search for top-level declarations
-            type_match = re.search(
-                r"\b(?:public\s+)?(class|interface|enum|record)\s+([A-Za-z_]\w*)",
-                cleaned,
-            )
-
-            if type_match:
-                typename = type_match.group(2)
+            # --- 2️⃣ Scan for class/interface/enum/record, skipping comments and strings ---
+            typename = _find_type_name(original_block)
+
+            if typename:
                 filename = os.path.join(OUTPUT_DIR, f"{typename}.java")
             else:
                 # --- 3️⃣ Fallback: Unknown file ---
                 filename = os.path.join(OUTPUT_DIR, f"Unknown_{timestamp}_{idx}.java")
 
-        # --- 4️⃣ Write file safely ---
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(original_block.strip() + "\n")
+        outputs[filename] = original_block.strip() + "\n"
+
+    # --- 4️⃣ Write files concurrently ---
+    _write_java_files(outputs)
+
 
+def _write_java_files(outputs):
+    """Schreibt {pfad: inhalt} parallel über den Thread-Pool."""
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as ex:
+        futures = {filename: ex.submit(_write_all, filename, content) for filename, content in outputs.items()}
+    for filename, future in futures.items():
+        future.result()
         print(f"💾 Datei erstellt: {filename}")
 
 
-# === Hauptlogik ===
-if "--help" in sys.argv:
+# === Modi ===
+
+
+def run_help():
     print_help()
-    sys.exit(0)
 
-elif "--fix" in sys.argv:
+
+def run_fix():
+    """Korrigiert die Java-Dateien in OUTPUT_DIR anhand von error.txt (parallele Anfragen)."""
     print("🔧 Fix-Modus aktiviert.")
 
-    # Alle Java-Dateien einlesen
-    java_files = {}
-    for fname in os.listdir(OUTPUT_DIR):
-        if fname.endswith(".java"):
-            with open(os.path.join(OUTPUT_DIR, fname), "r", encoding="utf-8") as f:
-                java_files[fname] = f.read()
+    # Alle Java-Dateien und den Fehlertext einlesen
+    java_files, error_text = _load_fix_inputs()
+
+    groups = _group_fix_files(java_files)
+
+    async def main():
+        # Mehrere Dateien pro Anfrage bündeln, alle Anfragen parallel
+        names = list(java_files)
+        async with _new_client() as client:
+            tasks = [
+                call_openai(client, _build_fix_messages(group, names, error_text), json_reply=True)
+                for group in groups
+            ]
+            # Fehler einzelner Gruppen nicht durchreichen, sonst gehen die übrigen Antworten verloren
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+    replies = []
+    for group, result in zip(groups, asyncio.run(main())):
+        if isinstance(result, Exception):
+            files = ", ".join(n for n, _ in group)
+            print(f"❌ Anfrage für {files} fehlgeschlagen: {result!r}")
+        else:
+            replies.append(result)
 
-    if not java_files:
-        print("⚠️ Keine Java-Dateien im Output-Ordner gefunden.")
+    if not replies:
+        print("⚠️ Keine Fix-Anfrage war erfolgreich.")
         sys.exit(1)
+    _save_fix_replies(replies)
 
-    # Fehlertext einlesen
-    if not os.path.exists(ERROR_FILE):
-        print(f"⚠️ Fehlerdatei '{ERROR_FILE}' nicht gefunden.")
-        sys.exit(1)
 
-    with open(ERROR_FILE, "r", encoding="utf-8") as f:
-        error_text = f.read().strip()
+def run_fix_batch():
+    """Startet die Korrektur als OpenAI-Batch und merkt sich die Batch-ID."""
+    print("📦 Fix-Batch-Modus aktiviert.")
 
-    code_summary = "\n\n".join(
-        [f"// Datei: {n}\n{c}" for n, c in java_files.items()])
-    fix_prompt = (
-        "Du bist ein erfahrener Java-Entwickler. "
-        "Hier sind mehrere Java-Dateien und eine Compiler-Fehlermeldung. "
-        "Analysiere den Fehler und gib die korrigierten vollständigen Java-Dateien "
-        "im Codeblock-Format (```java ... ```) zurück.\n\n"
-        f"{code_summary}\n\nCompiler-Fehlermeldung:\n{error_text}"
-    )
+    java_files, error_text = _load_fix_inputs()
 
-    messages = [
-        {"role": "system", "content": "Du bist ein Java-Code-Fixer."},
-        {"role": "user", "content": fix_prompt},
-    ]
+    async def main():
+        names = list(java_files)
+        requests_by_id = {
+            f"fix-{i}": _build_fix_messages(group, names, error_text)
+            for i, group in enumerate(_group_fix_files(java_files), start=1)
+        }
+        async with _new_client() as client:
+            return await submit_fix_batch(client, requests_by_id)
 
-    reply = call_openai(messages)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    batch_id = asyncio.run(main())
+    _write_all(BATCH_ID_FILE, batch_id)
+    print(f"✅ Batch gestartet: {batch_id}")
+    print("ℹ️ Ergebnisse später mit --fix-poll abholen.")
 
-    output_md = os.path.join(OUTPUT_DIR, f"fix_{timestamp}.md")
-    with open(output_md, "w", encoding="utf-8") as f:
-        f.write(reply)
-    print(f"✅ Fix-Ergebnis gespeichert in: {output_md}")
 
-    save_java_files(reply, timestamp)
-    print("🎉 Java-Dateien wurden mit den Korrekturen überschrieben.")
+def run_fix_poll():
+    """Holt die Ergebnisse des Batches aus --fix-batch ab, falls er fertig ist."""
+    print("📥 Fix-Poll-Modus aktiviert.")
+
+    try:
+        batch_id = Path(BATCH_ID_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        print(f"⚠️ Datei '{BATCH_ID_FILE}' nicht gefunden. Zuerst --fix-batch ausführen.")
+        sys.exit(1)
+
+    async def main():
+        async with _new_client() as client:
+            return await retrieve_batch(client, batch_id)
+
+    status, replies = asyncio.run(main())
+    if status in ("failed", "expired", "cancelled"):
+        print(f"❌ Batch {batch_id} ist im Status '{status}'.")
+        sys.exit(1)
+    if status != "completed":
+        print(f"⏳ Batch {batch_id} ist noch nicht fertig (Status: '{status}').")
+        sys.exit(0)
+    if not replies:
+        print("⚠️ Batch abgeschlossen, aber keine erfolgreichen Antworten erhalten.")
+        sys.exit(1)
 
-elif "--debug" in sys.argv:
+    _save_fix_replies(replies)
+    # Batch ist verarbeitet; sonst würde jedes weitere --fix-poll die Dateien erneut überschreiben
+    os.remove(BATCH_ID_FILE)
+
+
+def run_debug():
+    """Sendet debug.txt und result.md an die API und speichert die Antwort in response.md."""
     print("🐞 Debug-Modus aktiviert.")
 
-    # Dateien prüfen
-    if not os.path.exists(DEBUG_FILE):
+    # Dateien lesen (ein Zugriff pro Datei, fehlende Dateien über FileNotFoundError)
+    try:
+        debug_prompt = Path(DEBUG_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
         print(f"⚠️ Datei '{DEBUG_FILE}' nicht gefunden.")
         sys.exit(1)
-    if not os.path.exists(RESULT_FILE):
+    try:
+        project_code = Path(RESULT_FILE).read_text(encoding="utf-8")
+    except FileNotFoundError:
         print(f"⚠️ Datei '{RESULT_FILE}' nicht gefunden.")
         sys.exit(1)
 
-    # Dateien lesen
-    with open(DEBUG_FILE, "r", encoding="utf-8") as f:
-        debug_prompt = f.read().strip()
-    with open(RESULT_FILE, "r", encoding="utf-8") as f:
-        project_code = f.read()
-
     debug_input = (
         f"{debug_prompt}\n\n"
         "Hier ist der vollständige Projektcode (aus result.md):\n\n"
@@ -309,38 +783,64 @@ elif "--debug" in sys.argv:
         {"role": "user", "content": debug_input},
     ]
 
-    reply = call_openai(messages)
+    async def main():
+        async with _new_client() as client:
+            return await call_openai(client, messages, output_path=RESPONSE_FILE)
 
-    with open(RESPONSE_FILE, "w", encoding="utf-8") as f:
-        f.write(reply)
+    asyncio.run(main())
 
     print(f"✅ Debug-Antwort gespeichert in: {RESPONSE_FILE}")
 
-else:
-    # === GENERATE-MODUS ===
-    with open(PROMPT_FILE, "r", encoding="utf-8") as f:
-        custom_prompt = f.read().strip()
 
-    exam_text = pdf_to_text(PDF_FILE)
-    print(f"📘 PDF erfolgreich geladen ({len(exam_text.split())} Wörter).")
-
-    messages = [
-        {
-            "role": "system",
-            "content": "Du bist ein Java-Codegenerator. Antworte mit vollständigen, kompilierbaren und funktionierenden Java-Dateien im Codeblock.",
-        },
-        {
-            "role": "user",
-            "content": f"{custom_prompt}\n\nKlausuraufgabe:\n{exam_text}",
-        },
-    ]
+def run_generate():
+    """Generiert Java-Dateien aus klausur.pdf und prompt.txt."""
+    try:
+        custom_prompt = Path(PROMPT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        print(f"⚠️ Datei '{PROMPT_FILE}' nicht gefunden.")
+        sys.exit(1)
 
-    reply = call_openai(messages)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
     output_md = os.path.join(OUTPUT_DIR, f"result_{timestamp}.md")
-    with open(output_md, "w", encoding="utf-8") as f:
-        f.write(reply)
+
+    async def main():
+        async with _new_client() as client:
+            # Verbindungsaufbau läuft parallel zum Parsen der PDF
+            warm_up = asyncio.create_task(_warm_up(client))
+            exam_text = await asyncio.to_thread(pdf_to_text, PDF_FILE)
+            print(f"📘 PDF erfolgreich geladen ({len(exam_text.split())} Wörter).")
+
+            messages = [
+                {
+                    "role": "system",
+                    "content": "Du bist ein Java-Codegenerator. Antworte mit vollständigen, kompilierbaren und funktionierenden Java-Dateien im Codeblock.",
+                },
+                {
+                    "role": "user",
+                    "content": f"{custom_prompt}\n\nKlausuraufgabe:\n{exam_text}",
+                },
+            ]
+
+            await warm_up
+            return await call_openai(client, messages, output_path=output_md)
+
+    reply = asyncio.run(main())
     print(f"✅ KI-Antwort gespeichert in: {output_md}")
 
     save_java_files(reply, timestamp)
+
+
+MODES = {
+    "--help": run_help,
+    "--fix": run_fix,
+    "--fix-batch": run_fix_batch,
+    "--fix-poll": run_fix_poll,
+    "--debug": run_debug,
+}
+
+
+# === Hauptlogik ===
+# Guard nötig, damit ProcessPool-Worker (spawn) die Hauptlogik nicht erneut ausführen
+if __name__ == "__main__":
+    # Erster bekannter Modus-Schalter gewinnt, ohne Schalter wird generiert
+    next((MODES[arg] for arg in sys.argv[1:] if arg in MODES), run_generate)()